@@ -0,0 +1,172 @@
+import re
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+# Rough approximation used by OpenAI for English text, avoids pulling in a tokenizer dependency
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 500
+TOP_N_VALUES = 5
+
+COLUMNS = ["registration_date_and_plan_ref", "property_description", "date_of_lease_and_term", "lessees_title",
+           "notes"]
+
+DATE_PATTERN = re.compile(r"\b(\d{1,2})[/\.](\d{1,2})[/\.](\d{4})\b")
+TERM_PATTERN = re.compile(r"(\d+)\s+years?", re.IGNORECASE)
+PLAN_REF_PATTERN = re.compile(r"^\d{1,2}[/\.]\d{1,2}[/\.]\d{4}\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a string
+    :param text: string to estimate
+    :return: approximate token count
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    """
+    Parse the first dd.mm.yyyy or dd/mm/yyyy date found in the value
+    :param value: string to search for a date
+    :return: datetime if a valid date was found, otherwise None
+    """
+    match = DATE_PATTERN.search(value or "")
+    if not match:
+        return None
+    day, month, year = (int(group) for group in match.groups())
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def _layout_pattern(value: str) -> str:
+    """
+    Collapse a value into its character layout, e.g. EGL551039 -> AAA999999
+    :param value: string to collapse
+    :return: layout pattern of the string
+    """
+    return re.sub(r"\d", "9", re.sub(r"[A-Za-z]", "A", value))
+
+
+def _is_missing(value) -> bool:
+    """
+    Check if a value is missing, DataFrame records hold missing values as NaN rather than None
+    :param value: value to check
+    :return: True if the value is None or NaN
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _column_type(values: list) -> str:
+    """
+    Describe the python type held in a column, ignoring missing values
+    :param values: list of values in the column
+    :return: comma separated type names
+    """
+    types = sorted({type(value).__name__ for value in values if not _is_missing(value)})
+    return ", ".join(types) or "empty"
+
+
+def build_dataset_profile(records: List[dict]) -> dict:
+    """
+    Precompute a compact profile of the lease entries so the agent does not have to discover the data's shape
+    by running exploratory code. Should be called once when the data is loaded.
+    :param records: list of lease entry dictionaries, as produced from LeaseEntry.__dict__
+    :return: dictionary describing the columns, value distributions, layout patterns and date ranges
+    """
+    columns = {}
+    for column in COLUMNS:
+        values = [record.get(column) for record in records]
+        columns[column] = {
+            "type": _column_type(values),
+            "non_empty": sum(1 for value in values if value and not _is_missing(value)),
+        }
+
+    registration_dates = [_parse_date(record.get("registration_date_and_plan_ref")) for record in records]
+    lease_dates = [_parse_date(record.get("date_of_lease_and_term")) for record in records]
+    registration_dates = [date for date in registration_dates if date]
+    lease_dates = [date for date in lease_dates if date]
+
+    terms = Counter()
+    plan_refs = Counter()
+    title_patterns = Counter()
+    for record in records:
+        term = TERM_PATTERN.search(record.get("date_of_lease_and_term") or "")
+        if term:
+            terms[f"{term.group(1)} years"] += 1
+        plan_ref = PLAN_REF_PATTERN.sub("", record.get("registration_date_and_plan_ref") or "")
+        if plan_ref:
+            # Strip the plan numbers so that e.g. "numbered 2 in blue" and "numbered 3 in blue" are grouped
+            plan_refs[re.sub(r"\d+", "N", plan_ref.lower())] += 1
+        if record.get("lessees_title"):
+            title_patterns[_layout_pattern(record["lessees_title"])] += 1
+
+    return {
+        "rows": len(records),
+        "schedules": len({record.get("page_num") for record in records}),
+        "columns": columns,
+        "registration_date_range": (min(registration_dates), max(registration_dates)) if registration_dates else None,
+        "lease_date_range": (min(lease_dates), max(lease_dates)) if lease_dates else None,
+        "common_terms": terms.most_common(TOP_N_VALUES),
+        "common_plan_refs": plan_refs.most_common(TOP_N_VALUES),
+        "lessees_title_patterns": title_patterns.most_common(TOP_N_VALUES),
+        "with_notes": sum(1 for record in records if record.get("notes") and not _is_missing(record["notes"])),
+    }
+
+
+def _column_lines(profile: dict) -> List[str]:
+    """
+    Render the header and column descriptions, the agent's only description of the columns
+    :param profile: dictionary returned by build_dataset_profile
+    :return: list of lines which are always injected into the prompt
+    """
+    lines = [f"{profile['rows']} lease entries across {profile['schedules']} lease schedules (column page_num). Columns:"]
+    for column, details in profile["columns"].items():
+        lines.append(f"- {column}: {details['type']}, {details['non_empty']} non-empty")
+    return lines
+
+
+def _distribution_lines(profile: dict) -> List[str]:
+    """
+    Render the date ranges, value distributions and layout patterns, most useful first
+    :param profile: dictionary returned by build_dataset_profile
+    :return: list of lines to be injected into the prompt if they fit the token budget
+    """
+    lines = []
+    for label, key in (("Registration dates", "registration_date_range"), ("Lease dates", "lease_date_range")):
+        if profile[key]:
+            start, end = profile[key]
+            lines.append(f"{label} range from {start:%d.%m.%Y} to {end:%d.%m.%Y} (format dd.mm.yyyy, prefixes the column)")
+
+    lines.append(f"{profile['with_notes']} entries have notes, stored as a list of 'NOTE n: ...' strings or None.")
+    if profile["lessees_title_patterns"]:
+        patterns = ", ".join(f"{pattern} ({count})" for pattern, count in profile["lessees_title_patterns"])
+        lines.append(f"lessees_title layouts (A=letter, 9=digit): {patterns}")
+    if profile["common_terms"]:
+        terms = ", ".join(f"{term} ({count})" for term, count in profile["common_terms"])
+        lines.append(f"Most common lease terms: {terms}")
+    if profile["common_plan_refs"]:
+        plan_refs = ", ".join(f"'{plan_ref}' ({count})" for plan_ref, count in profile["common_plan_refs"])
+        lines.append(f"Most common plan refs after the date: {plan_refs}")
+    return lines
+
+
+def render_profile(profile: dict, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Render the profile within the token budget. The header and column lines are always included, the
+    remaining lines are added in order of usefulness and dropped from the tail once the budget is reached
+    :param profile: dictionary returned by build_dataset_profile
+    :param token_budget: maximum number of tokens the rendered profile should use
+    :return: string to be injected into the agent prompt
+    """
+    rendered = _column_lines(profile)
+    used_tokens = sum(estimate_tokens(line + "\n") for line in rendered)
+    for line in _distribution_lines(profile):
+        line_tokens = estimate_tokens(line + "\n")
+        if used_tokens + line_tokens > token_budget:
+            break
+        rendered.append(line)
+        used_tokens += line_tokens
+    return "\n".join(rendered)
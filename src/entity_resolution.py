@@ -0,0 +1,354 @@
+import re
+from collections import defaultdict, Counter
+from itertools import chain
+from typing import Iterable, List, Tuple
+from lease_entry import LeaseEntry
+
+NGRAM_SIZE = 3
+SIMILARITY_THRESHOLD = 0.8
+# A single missing letter removes up to three trigrams, which drops short keys such as "harbrd close" well below
+# the threshold, so keys at least this long which differ only by one letter are also treated as the same building
+MIN_TYPO_KEY_LENGTH = 8
+# Blocks shared by more canonical building keys than this are too common to discriminate, e.g. "roa" from "road"
+MAX_BLOCK_SIZE = 50
+# Only the rarest blocks of each key are searched, so a key is compared with at most
+# MAX_BLOCKS_PER_KEY * MAX_BLOCK_SIZE canonical keys however many keys there are
+MAX_BLOCKS_PER_KEY = 4
+
+PARENTHESES_PATTERN = re.compile(r"\(([^)]*)\)?")
+SEPARATOR_PATTERN = re.compile(r"[,;:]")
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^a-z0-9,]+")
+NUMBER_RANGE_PATTERN = re.compile(r"\b([0-9]+)\s*-\s*([0-9]+)\b")
+
+ORDINAL = r"(?:(?:twenty|thirty|forty|fifty) )?(?:first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|" \
+          r"eleventh|twelfth|thirteenth|fourteenth|fifteenth|sixteenth|seventeenth|eighteenth|nineteenth|" \
+          r"twentieth|thirtieth|fortieth|fiftieth)|[0-9]+(?:st|nd|rd|th)"
+LEVEL = rf"(?:lower ground|upper ground|ground|basement|{ORDINAL})"
+LIST_SEPARATOR = r"(?: , and | , | and | to )"
+LEVEL_PATTERN = re.compile(rf"\b{LEVEL}\b")
+FLOOR_PATTERN = re.compile(
+    rf"\b{LEVEL}(?:(?:{LIST_SEPARATOR}| ){LEVEL})* floors?(?: flats?| premises| maisonette| shop| unit)?(?: and basement)?\b")
+# Basement and lower ground levels are often described without the word floor, e.g. "Basement Flat"
+BASEMENT_PATTERN = re.compile(
+    r"\b(?:lower ground|upper ground|basement)(?: floors?)?(?: flats?| unit| level| premises| maisonette)?\b")
+
+UNIT_TYPES = r"flat|apartment|unit|(?:car )?parking space|garage|store|plot|suite|room|site|building"
+# A numbered flat is keyed on its number alone, the same as a house number without a floor
+FLAT_TYPES = {"flat", "apartment"}
+NUMBER = r"[0-9]+[a-z]?"
+UNIT_ID = rf"(?:{NUMBER}|[a-z](?![a-z0-9]))"
+# Only plural unit types take a comma separated list, so "Flat 5, 34 Bluebell Road" is not read as flats 5 and 34
+UNIT_PATTERN = re.compile(rf"\b({UNIT_TYPES}) ({UNIT_ID}(?:(?: and | to ){NUMBER})*)\b")
+PLURAL_UNIT_PATTERN = re.compile(rf"\b({UNIT_TYPES})s ({UNIT_ID}(?:{LIST_SEPARATOR}{UNIT_ID})*)\b")
+# A leading number is a house number unless it is a measurement, e.g. "17 acres of land at Ulpha"
+HOUSE_NUMBER_PATTERN = re.compile(
+    rf"^{NUMBER}(?:{LIST_SEPARATOR}{NUMBER})*\b(?! (?:acres?|hectares?|square|sq|metres?|meters?|feet|ft|miles?)\b)")
+ADDITIONAL_UNIT_PATTERN = re.compile(r"\band (?:[0-9]+[a-z]?|(?:car )?parking spaces?|garages?|stores?)\b")
+NUMBER_LIST_PATTERN = re.compile(rf"{NUMBER}(?:{LIST_SEPARATOR}{NUMBER})*")
+NUMBERED_FLOOR_PATTERN = re.compile(rf"({NUMBER_LIST_PATTERN.pattern}) {LEVEL}(?: {LEVEL})*")
+
+
+def normalise_text(text: str) -> str:
+    """
+    Normalise a string so that entries which only differ by case, spacing or punctuation share the same key
+    :param text: string to normalise
+    :return: lower case string of alphanumeric words separated by a single space
+    """
+    return " ".join(_tokenise(text).replace(",", " ").split())
+
+
+def _tokenise(text: str) -> str:
+    """
+    Lower case the text and reduce punctuation to spaces, keeping list separators as a standalone ","
+    and number ranges such as 88-96 as "88 to 96". A range of two consecutive numbers, e.g. 59-60, is the
+    same as "59 and 60" so it becomes "59 and 60"
+    :param text: string to tokenise
+    :return: lower case string of alphanumeric words and "," separated by a single space
+    """
+    text = NUMBER_RANGE_PATTERN.sub(_number_range, (text or "").lower().replace("&", " and "))
+    text = SEPARATOR_PATTERN.sub(" , ", text)
+    return " ".join(NON_ALPHANUMERIC_PATTERN.sub(" ", text).split())
+
+
+def _number_range(match: re.Match) -> str:
+    """
+    Replace a number range with its canonical form
+    :param match: match of NUMBER_RANGE_PATTERN
+    :return: "N and M" for consecutive numbers, otherwise "N to M"
+    """
+    start, end = match.groups()
+    separator = "and" if int(end) == int(start) + 1 else "to"
+    return f" {start} {separator} {end} "
+
+
+def normalise_title(title: str) -> str:
+    """
+    Normalise a lessee's title, e.g. " egl 551039" -> "EGL551039"
+    :param title: lessee's title to normalise
+    :return: upper case title with whitespace and punctuation removed
+    """
+    return re.sub(r"[^A-Z0-9]", "", (title or "").upper())
+
+
+def _find_units(text: str) -> List[re.Match]:
+    """
+    Find the flat, unit and parking space numbers in the text
+    :param text: tokenised property description
+    :return: list of matches in order of appearance, the groups being the unit type and its numbers
+    """
+    matches = list(UNIT_PATTERN.finditer(text)) + list(PLURAL_UNIT_PATTERN.finditer(text))
+    return sorted(matches, key=lambda match: match.start())
+
+
+def _remove_matches(text: str, matches: List[re.Match]) -> str:
+    """
+    Remove the matched spans from the text
+    :param text: string the matches were found in
+    :param matches: non overlapping matches to remove
+    :return: text with the matches replaced by a space
+    """
+    for match in sorted(matches, key=lambda match: match.start(), reverse=True):
+        text = text[:match.start()] + " " + text[match.end():]
+    return text
+
+
+def _remove_floors(text: str) -> Tuple[str, List[str]]:
+    """
+    Remove the floor descriptions from the text
+    :param text: tokenised property description
+    :return: the text without floor descriptions and the levels they mention, e.g. ["first", "second"]
+    """
+    levels = []
+    for pattern in (FLOOR_PATTERN, BASEMENT_PATTERN):
+        matches = list(pattern.finditer(text))
+        for match in matches:
+            levels.extend(level for level in LEVEL_PATTERN.findall(match.group()) if level not in levels)
+        text = _remove_matches(text, matches)
+    return " ".join(text.split()), levels
+
+
+def split_unit_and_building(property_description: str) -> Tuple[str, str]:
+    """
+    Split a property description into its unit and building keys, e.g.
+    "Flat  207, Landmark West Tower (second floor flat)" -> ("207", "landmark west tower")
+    "3 Market Place (Basement Unit)" -> ("3 basement", "market place")
+    "Parking space 10 (basement level)" -> ("parking space 10", "")
+    The floor is dropped when a flat or unit number identifies the unit. A house number keeps its floor, as in
+    converted houses and shops it is what tells the units apart, PropertyIndex then merges "Flat 50" into
+    "50 (Fourth Floor Flat)" when there is only one unit with that number in the building.
+    :param property_description: property description of the lease entry
+    :return: tuple of the normalised unit and building, either of which may be empty
+    """
+    property_description = property_description or ""
+    text, levels = _remove_floors(_tokenise(PARENTHESES_PATTERN.sub(" , ", property_description)))
+    for detail in PARENTHESES_PATTERN.findall(property_description):
+        levels.extend(level for level in _remove_floors(_tokenise(detail))[1] if level not in levels)
+    text = text.lstrip(", ")
+
+    # The first unit is the one being leased, any further units such as "and Garage 7" are dropped
+    unit_matches = _find_units(text)
+    house_number = HOUSE_NUMBER_PATTERN.search(text)
+    if house_number:
+        unit = " ".join([house_number.group()] + levels)
+        text = _remove_matches(text, unit_matches + [house_number])
+    elif unit_matches:
+        unit_type, unit_numbers = unit_matches[0].groups()
+        if unit_type in FLAT_TYPES and NUMBER_LIST_PATTERN.fullmatch(unit_numbers):
+            unit = unit_numbers
+        else:
+            unit = f"{unit_type} {unit_numbers}"
+        text = _remove_matches(text, unit_matches).lstrip(", ")
+        # e.g. "Flat A, 34 Bluebell Road", the house number belongs to the unit rather than the building
+        house_number = HOUSE_NUMBER_PATTERN.search(text)
+        if house_number:
+            unit = f"{house_number.group()} {unit}"
+            text = text[house_number.end():]
+    else:
+        unit = " ".join(levels)
+
+    words = ADDITIONAL_UNIT_PATTERN.sub(" ", text).replace(",", " ").split()
+    while words and words[0] == "and":
+        words.pop(0)
+    while words and words[-1] == "and":
+        words.pop()
+    return " ".join(unit.replace(",", " ").split()), " ".join(words)
+
+
+def _ngrams(key: str) -> set:
+    """
+    Character n-grams of the key with spaces removed, so "landmarkwest" and "landmark west" are alike
+    :param key: normalised building key
+    :return: set of n-grams
+    """
+    key = key.replace(" ", "")
+    if len(key) <= NGRAM_SIZE:
+        return {key}
+    return {key[i:i + NGRAM_SIZE] for i in range(len(key) - NGRAM_SIZE + 1)}
+
+
+def _code_tokens(key: str) -> set:
+    """
+    Tokens containing a digit, such as building codes and numbers, e.g. {"dc2"} for "dc2 cobalt business park"
+    :param key: normalised building key
+    :return: set of alphanumeric tokens
+    """
+    return {token for token in key.split() if any(character.isdigit() for character in token)}
+
+
+def _is_single_insertion(shorter: str, longer: str) -> bool:
+    """
+    Check if the longer key is the shorter key with one extra letter, e.g. "harbrd close" and "harbord close"
+    :param shorter: normalised building key
+    :param longer: normalised building key one character longer than the shorter key
+    :return: True if removing a single letter from the longer key gives the shorter key
+    """
+    for i, (short_character, long_character) in enumerate(zip(shorter, longer)):
+        if short_character != long_character:
+            return long_character.isalpha() and shorter[i:] == longer[i + 1:]
+    return longer[-1].isalpha()
+
+
+def _similarity(key: str, key_ngrams: set, candidate: str, candidate_ngrams: set) -> float:
+    """
+    Jaccard similarity of the n-grams of two building keys, raised to the threshold if the keys differ by a
+    single inserted or deleted letter
+    :param key: normalised building key
+    :param key_ngrams: n-grams of the key
+    :param candidate: normalised canonical building key
+    :param candidate_ngrams: n-grams of the candidate
+    :return: similarity between 0 and 1
+    """
+    shared = len(key_ngrams & candidate_ngrams)
+    similarity = shared / (len(key_ngrams) + len(candidate_ngrams) - shared)
+    if similarity < SIMILARITY_THRESHOLD and abs(len(key) - len(candidate)) == 1:
+        shorter, longer = sorted((key, candidate), key=len)
+        if len(shorter) >= MIN_TYPO_KEY_LENGTH and _is_single_insertion(shorter, longer):
+            return SIMILARITY_THRESHOLD
+    return similarity
+
+
+def cluster_building_keys(building_keys: Counter) -> dict:
+    """
+    Cluster near-duplicate building keys using n-gram blocking. Keys are visited from most to least common and
+    each is compared only with the canonical keys in its rarest shared n-gram blocks, rather than with all other
+    keys, so the cost per key is bounded and the total cost grows linearly with the number of keys.
+    A key joins the most similar canonical key above the threshold, so every key in a cluster is similar to its
+    canonical key rather than being chained in through other members. Keys with differing building codes or
+    numbers are never merged. A single substituted letter, e.g. "mill lane" and "hill lane", is not treated as
+    a typo as it often names a different building.
+    :param building_keys: counter of normalised building keys and the number of entries with that key
+    :return: dictionary mapping each building key to its canonical building key
+    """
+    canonical_keys = {}
+    canonical_ngrams = {}
+    blocks = defaultdict(list)
+    for key in sorted(building_keys, key=lambda k: (-building_keys[k], k)):
+        key_ngrams = _ngrams(key)
+        # Blocking on the codes as well as the n-gram means keys with differing codes are never compared
+        key_codes = frozenset(_code_tokens(key))
+        key_blocks = [(key_codes, ngram) for ngram in key_ngrams]
+        # A near duplicate shares most of the key's n-grams, so it is found in the rarest non-empty blocks
+        searched_blocks = sorted((block for block in key_blocks if 0 < len(blocks.get(block, ())) <= MAX_BLOCK_SIZE),
+                                 key=lambda block: (len(blocks[block]), block[1]))[:MAX_BLOCKS_PER_KEY]
+        candidates = {candidate for block in searched_blocks for candidate in blocks[block]}
+
+        best_key, best_similarity = key, 0
+        for candidate in sorted(candidates):
+            similarity = _similarity(key, key_ngrams, candidate, canonical_ngrams[candidate])
+            if similarity >= SIMILARITY_THRESHOLD and similarity > best_similarity:
+                best_key, best_similarity = candidate, similarity
+
+        canonical_keys[key] = best_key
+        # Only canonical keys are added to the blocks, so later keys are compared against the cluster itself
+        if best_key == key:
+            canonical_ngrams[key] = key_ngrams
+            for block in key_blocks:
+                blocks[block].append(key)
+    return canonical_keys
+
+
+class PropertyIndex:
+    """
+    Class to resolve lease entries to the buildings and units they describe
+    """
+
+    def __init__(self, lease_entries: Iterable[LeaseEntry]):
+        self.buildings = defaultdict(lambda: defaultdict(list))
+        self.titles = defaultdict(list)
+
+        keyed_entries = []
+        building_keys = Counter()
+        for lease_entry in lease_entries:
+            unit, building = split_unit_and_building(lease_entry.property_description)
+            # Without a building name the entry can only be tied to the parent title it was registered against
+            building = building or f"schedule {lease_entry.page_num}"
+            building_keys[building] += 1
+            keyed_entries.append((building, unit, lease_entry))
+
+            title = normalise_title(lease_entry.lessees_title)
+            if title:
+                self.titles[title].append(lease_entry)
+
+        canonical_keys = cluster_building_keys(building_keys)
+        for building, unit, lease_entry in keyed_entries:
+            self.buildings[canonical_keys[building]][unit].append(lease_entry)
+        for units in self.buildings.values():
+            self._merge_units_without_floors(units)
+
+    @staticmethod
+    def _merge_units_without_floors(units: dict):
+        """
+        Merge units described without a floor, e.g. "Flat 207", into the unit with the same number and a floor,
+        e.g. "Flat 207 (second floor flat)", when there is only one such unit in the building
+        :param units: dictionary of unit keys to their lease entries for a single building
+        """
+        floored_units = defaultdict(list)
+        for unit in units:
+            match = NUMBERED_FLOOR_PATTERN.fullmatch(unit)
+            if match:
+                floored_units[match.group(1)].append(unit)
+
+        for number, floored in floored_units.items():
+            if number in units and len(floored) == 1:
+                units[floored[0]].extend(units.pop(number))
+
+    def group_by_building(self) -> dict:
+        """
+        Building level view of the lease entries
+        :return: dictionary of building keys to a dictionary of unit keys and their lease entries
+        """
+        return {building: dict(units) for building, units in self.buildings.items()}
+
+    def building_summary(self) -> List[dict]:
+        """
+        Summarise each building, suitable for loading into a DataFrame
+        :return: list of dictionaries with the building, unit count, entry count and lessees titles
+        """
+        summary = []
+        for building, units in self.buildings.items():
+            lease_entries = list(chain(*units.values()))
+            summary.append({
+                "building": building,
+                "units": len(units),
+                "entries": len(lease_entries),
+                "lessees_titles": sorted({normalise_title(entry.lessees_title) for entry in lease_entries} - {""}),
+            })
+        return sorted(summary, key=lambda building: building["entries"], reverse=True)
+
+    def find_by_title(self, title: str) -> List[LeaseEntry]:
+        """
+        Find the lease entries registered against a lessee's title
+        :param title: lessee's title, in any case or spacing
+        :return: list of lease entries with a matching title
+        """
+        return self.titles.get(normalise_title(title), [])
+
+
+def build_property_index(full_lease_schedules: dict) -> PropertyIndex:
+    """
+    Build a PropertyIndex from the output of paginate_json_file
+    :param full_lease_schedules: dictionary of lease schedules returned by paginate_json_file
+    :return: PropertyIndex of all the lease entries
+    """
+    return PropertyIndex(chain(*[lease for lease_schedule in full_lease_schedules.values()
+                                 for lease in lease_schedule.values()]))
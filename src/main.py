@@ -1,6 +1,7 @@
 from concurrency_test import compare_time_difference
+from entity_resolution import build_property_index, PropertyIndex
 from model import get_ai_model
-from parse_data import paginate_json_file, PAGE_SIZE
+from parse_data import paginate_json_file, PAGE_SIZE, QUARANTINE_FILE
 from itertools import chain
 import pandas as pd
 
@@ -17,6 +18,17 @@ def save_leases_to_csv(leases: dict):
     df.to_csv('lease_entries.csv', index=False)
 
 
+def save_buildings_to_csv(property_index: PropertyIndex):
+    """
+    Save the building level view of the leases to a CSV file with the following columns:
+    [building, units, entries, lessees_titles]
+    :param property_index: PropertyIndex built from the parsed leases
+    """
+    df = pd.DataFrame(property_index.building_summary())
+    df.to_csv('lease_buildings.csv', index=False)
+
+
 if __name__ == '__main__':
-    full_lease_dictionary = paginate_json_file('src/schedule_of_notices_of_lease_examples.json', PAGE_SIZE)
-    save_leases_to_csv(full_lease_dictionary)
\ No newline at end of file
+    full_lease_dictionary = paginate_json_file('src/schedule_of_notices_of_lease_examples.json', PAGE_SIZE, QUARANTINE_FILE)
+    save_leases_to_csv(full_lease_dictionary)
+    save_buildings_to_csv(build_property_index(full_lease_dictionary))
\ No newline at end of file
@@ -1,17 +1,43 @@
+import json
+import logging
 import os
 import pandas as pd
+from datetime import datetime
 from itertools import chain
 from langchain.agents import AgentExecutor
+from langchain.callbacks import get_openai_callback
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryMemory, ConversationKGMemory, \
     CombinedMemory
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+from context_builder import build_dataset_profile, render_profile, DEFAULT_TOKEN_BUDGET
 from parse_data import paginate_json_file, PAGE_SIZE
 from dotenv import load_dotenv
 
 load_dotenv()
 
 OPEN_API_KEY = os.getenv("OPEN_API_KEY")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+# Metrics are appended across sessions so runs before and after a prompt change can be compared
+QUESTION_METRICS_FILE = os.getenv("QUESTION_METRICS_FILE", "question_metrics.jsonl")
+
+
+class AgentIterationCounter(BaseCallbackHandler):
+    """
+    Callback handler to count the number of agent iterations taken to answer a question
+    """
+    def __init__(self):
+        self.tool_calls = 0
+        self.iterations = 0
+
+    def on_agent_action(self, action, **kwargs):
+        self.tool_calls += 1
+        self.iterations += 1
+
+    def on_agent_finish(self, finish, **kwargs):
+        self.iterations += 1
+
 
 def get_df_from_lease_dictionary() -> (AgentExecutor, pd.DataFrame):
     """
@@ -24,24 +50,35 @@ def get_df_from_lease_dictionary() -> (AgentExecutor, pd.DataFrame):
 
     # Convert the list of dictionaries to a Pandas DataFrame
     df = pd.DataFrame(lease_entries_dict_list)
-    return get_ai_model(df), df
 
+    # Profile the data once at load time rather than having the agent explore it on every question
+    profile = build_dataset_profile(lease_entries_dict_list)
+    return get_ai_model(df, profile), df
 
-def get_ai_model(df: pd.DataFrame) -> AgentExecutor:
+
+def get_ai_model(df: pd.DataFrame, profile: dict = None, token_budget: int = CONTEXT_TOKEN_BUDGET) -> AgentExecutor:
     """
     Initialize the AI model with the Pandas DataFrame, the prompt and the chat history
     :param df:
+    :param profile: precomputed dataset profile, built from the DataFrame if not provided
+    :param token_budget: maximum number of tokens the dataset profile should use in the prompt, the column
+        descriptions are always included
     :return:
     """
+    if profile is None:
+        profile = build_dataset_profile(df.to_dict(orient="records"))
+    # Escape braces so the profile is not treated as prompt template variables
+    dataset_context = render_profile(profile, token_budget).replace("{", "{{").replace("}", "}}")
+
     llm = ChatOpenAI(
         temperature=0, model="gpt-4", openai_api_key=OPEN_API_KEY
     )
 
     prefix = """
     You are working with a pandas dataframe in Python. The name of the dataframe is `df`, use this if needed.
-    You have a dataset containing information on real estate sub leases with the following columns:
-    [registration_date_and_plan_ref, property_description, date_of_lease_and_term, lessees_title, notes]
-    
+    You have a dataset containing information on real estate sub leases, it has already been profiled as follows:
+    """ + dataset_context + """
+
     Summary of the whole conversation:
     {chat_history_summary}
 
@@ -83,5 +120,44 @@ def get_ai_model(df: pd.DataFrame) -> AgentExecutor:
     )
 
 
+def save_question_metrics(metrics: dict, file_path: str = QUESTION_METRICS_FILE):
+    """
+    Append the metrics for a question to a file, one json object per line
+    :param metrics: dictionary of metrics returned by ask_agent
+    :param file_path: path to the metrics file
+    """
+    with open(file_path, 'a') as f:
+        f.write(json.dumps(metrics) + "\n")
+
+
+def ask_agent(chat: AgentExecutor, question: str, metrics_path: str = QUESTION_METRICS_FILE) -> (str, dict):
+    """
+    Ask the agent a question, recording the number of iterations and tokens used to answer it
+    :param chat: agent returned by get_ai_model
+    :param question: question to ask the agent
+    :param metrics_path: path to append the question's metrics to, not saved if None
+    :return: the agent's response and a dictionary of metrics for the question
+    """
+    counter = AgentIterationCounter()
+    # Token counts include the calls made by the summary and KG memories
+    with get_openai_callback() as token_callback:
+        response = chat.run({"input": question}, callbacks=[counter])
+
+    metrics = {
+        "timestamp": datetime.now().isoformat(),
+        "context_token_budget": CONTEXT_TOKEN_BUDGET,
+        "question": question,
+        "iterations": counter.iterations,
+        "tool_calls": counter.tool_calls,
+        "prompt_tokens": token_callback.prompt_tokens,
+        "completion_tokens": token_callback.completion_tokens,
+        "total_tokens": token_callback.total_tokens,
+    }
+    logging.info(f"Answered question in {metrics['iterations']} iterations using {metrics['total_tokens']} tokens")
+    if metrics_path:
+        save_question_metrics(metrics, metrics_path)
+    return response, metrics
+
+
 def _handle_error(error) -> str:
     return str(error)
\ No newline at end of file
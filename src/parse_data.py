@@ -1,12 +1,14 @@
 import json
 import logging
 from collections import defaultdict
-from typing import List
+from typing import List, Optional
 from lease_entry import LeaseEntry
-from utils import EntryTypes, LeaseEntryError
+from quarantine import Quarantine
+from utils import EntryTypes, LeaseEntryError, QuarantineReasons
 
 PAGE_SIZE = 100
 DEFAULT_SCHEDULE = "SCHEDULE OF NOTICES OF LEASE"
+QUARANTINE_FILE = "quarantined_entries.jsonl"
 
 # Add logging to the console if we were to use this in a production environment
 logging.basicConfig(
@@ -18,36 +20,75 @@ logging.basicConfig(
 )
 
 
-def process_page(page_data: List[dict], page_num: int) -> dict:
+def validate_entry(entry) -> Optional[QuarantineReasons]:
+    """
+    Cheap structural check of an entry before it is parsed, so malformed rows are rejected without
+    raising and catching an exception
+    :param entry: raw schedule entry from the json file
+
+    :return: reason the entry is invalid, or None if it can be parsed
+    """
+    if not isinstance(entry, dict):
+        return QuarantineReasons.INVALID_ENTRY
+    if entry.get("entryNumber") is None:
+        return QuarantineReasons.MISSING_ENTRY_NUMBER
+    entry_text = entry.get("entryText")
+    if entry_text is None:
+        return QuarantineReasons.MISSING_ENTRY_TEXT
+    if not isinstance(entry_text, list):
+        return QuarantineReasons.INVALID_ENTRY_TEXT_TYPE
+    # None lines appear as blank lines within real entries and are skipped by the parser
+    lines = [line for line in entry_text if line is not None]
+    if not lines or not all(isinstance(line, str) for line in lines):
+        return QuarantineReasons.NON_STRING_LINE
+    if not any(line.strip() for line in lines):
+        return QuarantineReasons.EMPTY_ENTRY_TEXT
+    return None
+
+
+def process_page(page_data: List[dict], page_num: int, quarantine: Quarantine = None) -> dict:
     """
     Process the page_data separated by the page_size
     :param page_data: list of items to process
+    :param quarantine: collects the entries which could not be parsed, a summary is logged
+        at the end of the page if not provided
 
     :return: dictionary of lease entry objects
     """
+    page_quarantine = quarantine if quarantine is not None else Quarantine()
     lease_dict = defaultdict(list)
     for entry in page_data:
-        if entry["entryType"] == EntryTypes.CANCELLED_ITEM_SCHEDULE_OF_NOTICES_OF_LEASES.value:
+        # Cancelled entries are skipped before validation, as they are not expected to hold any lease text
+        if isinstance(entry, dict) and \
+                entry.get("entryType") == EntryTypes.CANCELLED_ITEM_SCHEDULE_OF_NOTICES_OF_LEASES.value:
+            continue
+        reason = validate_entry(entry)
+        if reason:
+            page_quarantine.add(entry, page_num, reason)
             continue
         try:
             lease_entry = LeaseEntry(data=entry["entryText"], entry_id=entry["entryNumber"], page_num=page_num)
-        except LeaseEntryError:
-            logging.error(
-                f"Invalid data received, row is being skipped for the entryText: {entry['entryText']}")
+        except LeaseEntryError as e:
+            page_quarantine.add(entry, page_num, QuarantineReasons.PARSE_ERROR, str(e))
             continue
         lease_dict[entry["entryNumber"]].append(lease_entry)
+
+    if quarantine is None:
+        page_quarantine.log_summary()
     return lease_dict
 
 
-def paginate_json_file(file_path: str, page_size: int) -> dict:
+def paginate_json_file(file_path: str, page_size: int, quarantine_path: str = None) -> dict:
     """
     Parse all the data from the json file, paginating based on the length of the schedule entry
     :param file_path: path to the json file
     :param page_size: number of items per page
+    :param quarantine_path: path to write the entries which could not be parsed to, along with their reason codes
 
     :return: dictionary of dictionaries, where the first key is the index of the leaseschedule how it appears in the json
     """
     full_lease_schedules = {}
+    quarantine = Quarantine()
 
     with open(file_path, 'r') as f:
         try:
@@ -70,9 +111,14 @@ def paginate_json_file(file_path: str, page_size: int) -> dict:
             while items_processed < len(lease_schedule["scheduleEntry"]):
                 logging.info(f"Processing page {items_processed // page_size}")
                 page_data = lease_schedule["scheduleEntry"][items_processed:items_processed + page_size]
-                current_lease_dict = process_page(page_data, i)
+                current_lease_dict = process_page(page_data, i, quarantine)
                 merged_lease_schedule = {**merged_lease_schedule, **current_lease_dict}
                 items_processed += page_size
 
             full_lease_schedules[i] = merged_lease_schedule
+
+    quarantine.log_summary()
+    # Always write the file so a clean run does not leave the previous run's failures in place
+    if quarantine_path:
+        quarantine.write(quarantine_path)
     return full_lease_schedules
@@ -0,0 +1,62 @@
+import json
+import logging
+from collections import Counter
+from utils import QuarantineReasons
+
+# Only the first few quarantined entries are logged individually, the rest are included in the summary
+MAX_LOGGED_ENTRIES = 10
+
+
+class Quarantine:
+    """
+    Class to collect entries which could not be parsed, along with the reason they were rejected
+    """
+
+    def __init__(self, max_logged_entries: int = MAX_LOGGED_ENTRIES):
+        self.max_logged_entries = max_logged_entries
+        self.entries = []
+        self.reason_counts = Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry, page_num: int, reason: QuarantineReasons, detail: str = ""):
+        """
+        Quarantine an entry, logging it only if the log limit has not been reached
+        :param entry: raw schedule entry from the json file
+        :param page_num: index of the lease schedule the entry belongs to
+        :param reason: reason the entry was rejected
+        :param detail: optional description of the error
+        """
+        entry_number = entry.get("entryNumber") if isinstance(entry, dict) else None
+        self.entries.append({
+            "page_num": page_num,
+            "entry_number": entry_number,
+            "reason": reason.value,
+            "detail": detail,
+            "entry": entry,
+        })
+        self.reason_counts[reason] += 1
+
+        if len(self.entries) <= self.max_logged_entries:
+            logging.warning(f"Quarantining entry {entry_number} of lease schedule {page_num}: {reason.value}")
+            if len(self.entries) == self.max_logged_entries:
+                logging.warning("Further quarantined entries will only be included in the summary")
+
+    def log_summary(self):
+        """
+        Log the number of quarantined entries for each reason
+        """
+        if not self.entries:
+            return
+        reasons = ", ".join(f"{reason.value}: {count}" for reason, count in self.reason_counts.most_common())
+        logging.error(f"{len(self.entries)} entries were quarantined ({reasons})")
+
+    def write(self, file_path: str):
+        """
+        Write the quarantined entries to a file, one json object per line
+        :param file_path: path to the quarantine file
+        """
+        with open(file_path, 'w') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, default=str) + "\n")
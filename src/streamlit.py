@@ -1,5 +1,5 @@
 import streamlit as st
-from model import get_df_from_lease_dictionary
+from model import get_df_from_lease_dictionary, ask_agent
 from dotenv import load_dotenv
 load_dotenv()
 def streamlit():
@@ -46,6 +46,10 @@ def streamlit():
     if "messages" not in st.session_state or st.sidebar.button("Clear conversation history"):
         st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
 
+    # Store the iterations and tokens used per question so prompt changes can be measured
+    if "question_metrics" not in st.session_state:
+        st.session_state["question_metrics"] = []
+
     # Display chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -61,10 +65,18 @@ def streamlit():
     if st.session_state.messages[-1]["role"] != "assistant":
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response = chat.run({"input": st.session_state.messages[-1]["content"]})
+                response, metrics = ask_agent(chat, st.session_state.messages[-1]["content"])
                 st.write(response)
+                st.session_state["question_metrics"].append(metrics)
 
         # Add the response to the chat history if its has not been written
         message = {"role": "assistant", "content": response}
         st.session_state.messages.append(message)
+
+    if st.session_state["question_metrics"]:
+        question_metrics = st.session_state["question_metrics"]
+        st.sidebar.subheader("Agent Metrics")
+        st.sidebar.write("Questions asked: " + str(len(question_metrics)))
+        st.sidebar.write("Average iterations per question: " + str(round(sum(m["iterations"] for m in question_metrics) / len(question_metrics), 2)))
+        st.sidebar.write("Average tokens per question: " + str(round(sum(m["total_tokens"] for m in question_metrics) / len(question_metrics), 2)))
 streamlit()
\ No newline at end of file
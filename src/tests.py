@@ -1,8 +1,20 @@
+import random
 import unittest
+from collections import Counter
 from unittest.mock import patch, mock_open
+from context_builder import build_dataset_profile, render_profile, estimate_tokens, COLUMNS
+import entity_resolution
+from entity_resolution import PropertyIndex, split_unit_and_building, cluster_building_keys
 from lease_entry import LeaseEntry
-from parse_data import process_page, PAGE_SIZE, paginate_json_file
-from utils import LeaseEntryError
+from parse_data import process_page, PAGE_SIZE, paginate_json_file, validate_entry
+from quarantine import Quarantine
+from utils import LeaseEntryError, QuarantineReasons
+
+# The agent requires the optional langchain and pandas dependencies
+try:
+    from model import AgentIterationCounter, save_question_metrics
+except ImportError:
+    AgentIterationCounter = None
 
 
 class BaseTestData(unittest.TestCase):
@@ -135,6 +147,71 @@ class TestParseData(BaseTestData):
         processed_page = process_page([self.invalid_data_entry], -1)
         self.assertEquals(len(processed_page.keys()), 0)
 
+    def test_process_page_quarantines_invalid_data(self):
+        quarantine = Quarantine()
+        processed_page = process_page([self.invalid_data_entry] + self.schedule_entries_1, -1, quarantine)
+        self.assertEqual(len(processed_page.keys()), 3)
+        self.assertEqual(len(quarantine), 1)
+        self.assertEqual(quarantine.entries[0]["entry_number"], "2")
+        self.assertEqual(quarantine.reason_counts[QuarantineReasons.NON_STRING_LINE], 1)
+
+    def test_process_page_skips_cancelled_entries_without_quarantine(self):
+        quarantine = Quarantine()
+        cancelled_entry = {"entryNumber": "5", "entryType": "Cancelled Item - Schedule of Notices of Leases"}
+        processed_page = process_page([cancelled_entry], -1, quarantine)
+        self.assertEqual(len(processed_page.keys()), 0)
+        self.assertEqual(len(quarantine), 0)
+
+    def test_process_page_quarantines_missing_entry_number(self):
+        quarantine = Quarantine()
+        processed_page = process_page([{"entryType": "Schedule of Notices of Leases", "entryText": ["text"]}], -1,
+                                      quarantine)
+        self.assertEqual(len(processed_page.keys()), 0)
+        self.assertEqual(len(quarantine), 1)
+        self.assertEqual(quarantine.reason_counts[QuarantineReasons.MISSING_ENTRY_NUMBER], 1)
+
+    def test_validate_entry(self):
+        self.assertIsNone(validate_entry(self.schedule_entries_1[0]))
+        self.assertEqual(validate_entry(None), QuarantineReasons.INVALID_ENTRY)
+        self.assertEqual(validate_entry({"entryText": ["text"]}), QuarantineReasons.MISSING_ENTRY_NUMBER)
+        self.assertEqual(validate_entry({"entryNumber": "1"}), QuarantineReasons.MISSING_ENTRY_TEXT)
+        self.assertEqual(validate_entry({"entryNumber": "1", "entryText": "text"}),
+                         QuarantineReasons.INVALID_ENTRY_TEXT_TYPE)
+        self.assertEqual(validate_entry({"entryNumber": "1", "entryText": ["", ""]}),
+                         QuarantineReasons.EMPTY_ENTRY_TEXT)
+        self.assertEqual(validate_entry({"entryNumber": "1", "entryText": ["   ", "  "]}),
+                         QuarantineReasons.EMPTY_ENTRY_TEXT)
+        self.assertEqual(validate_entry({"entryNumber": "1", "entryText": [None]}),
+                         QuarantineReasons.NON_STRING_LINE)
+        self.assertIsNone(validate_entry({"entryNumber": "1", "entryText": ["19.03.2146", None, "NOTE: text"]}))
+        self.assertEqual(validate_entry(self.invalid_data_entry), QuarantineReasons.NON_STRING_LINE)
+
+    def test_quarantine_logging_is_rate_limited(self):
+        quarantine = Quarantine(max_logged_entries=2)
+        with self.assertLogs(level="WARNING") as logs:
+            for _ in range(5):
+                quarantine.add(self.invalid_data_entry, -1, QuarantineReasons.NON_STRING_LINE)
+            quarantine.log_summary()
+        self.assertEqual(len(quarantine), 5)
+        # 2 entries, the rate limit notice and the summary
+        self.assertEqual(len(logs.output), 4)
+        self.assertIn("5 entries were quarantined (non_string_line: 5)", logs.output[-1])
+
+    @patch("builtins.open", new_callable=mock_open)
+    def test_quarantine_write(self, mock_file_open):
+        quarantine = Quarantine()
+        quarantine.add(self.invalid_data_entry, -1, QuarantineReasons.NON_STRING_LINE)
+        quarantine.write("quarantine.jsonl")
+        mock_file_open.assert_called_once_with("quarantine.jsonl", 'w')
+        written = mock_file_open().write.call_args[0][0]
+        self.assertIn('"reason": "non_string_line"', written)
+
+    @patch("builtins.open", new_callable=mock_open, read_data='[]')
+    def test_paginate_writes_empty_quarantine_file(self, mock_file_open):
+        paginate_json_file("leases.json", PAGE_SIZE, "quarantine.jsonl")
+        mock_file_open.assert_called_with("quarantine.jsonl", 'w')
+        mock_file_open().write.assert_not_called()
+
     def test_paginate_invalid_file(self):
         with self.assertRaises(FileNotFoundError):
             paginate_json_file(self.invalid_file, PAGE_SIZE)
@@ -206,5 +283,207 @@ class TestLeaseEntry(BaseTestData):
         self.assertEqual(lease_entry.lessees_title, "TGL461305")
 
 
+class TestContextBuilder(BaseTestData):
+    """
+    Test the context_builder.py file
+    """
+
+    def setUp(self):
+        super().setUp()
+        processed_page = process_page(self.schedule_entries_1, 0)
+        self.records = [entry.__dict__ for entries in processed_page.values() for entry in entries]
+
+    def test_build_dataset_profile(self):
+        profile = build_dataset_profile(self.records)
+        self.assertEqual(profile["rows"], 3)
+        self.assertEqual(profile["schedules"], 1)
+        self.assertEqual(profile["columns"]["notes"]["type"], "empty")
+        self.assertEqual(profile["registration_date_range"][0].strftime("%d.%m.%Y"), "24.06.2008")
+        self.assertEqual(profile["registration_date_range"][1].strftime("%d.%m.%Y"), "17.07.2008")
+        self.assertEqual(profile["common_terms"], [("125 years", 3)])
+        self.assertEqual(profile["lessees_title_patterns"], [("A999999", 3)])
+
+    def test_build_dataset_profile_treats_nan_as_missing(self):
+        # Records from DataFrame.to_dict hold missing notes as NaN
+        records = [dict(record, notes=float("nan")) for record in self.records]
+        profile = build_dataset_profile(records)
+        self.assertEqual(profile["columns"]["notes"], {"type": "empty", "non_empty": 0})
+        self.assertEqual(profile["with_notes"], 0)
+
+    def test_render_profile_within_budget(self):
+        profile = build_dataset_profile(self.records)
+        full_context = render_profile(profile, token_budget=10000)
+        limited_context = render_profile(profile, token_budget=120)
+        self.assertIn("125 years (3)", full_context)
+        self.assertLessEqual(estimate_tokens(limited_context), 120)
+        self.assertLess(len(limited_context), len(full_context))
+        # Lines are only dropped from the tail so the output is always a prefix of the full profile
+        self.assertTrue(full_context.startswith(limited_context))
+
+    def test_render_profile_always_describes_columns(self):
+        profile = build_dataset_profile(self.records)
+        for token_budget in (0, 5, 40):
+            context = render_profile(profile, token_budget=token_budget)
+            self.assertTrue(context.startswith("3 lease entries across 1 lease schedules"))
+            for column in COLUMNS:
+                self.assertIn(f"- {column}:", context)
+            self.assertNotIn("Most common lease terms", context)
+
+
+@unittest.skipIf(AgentIterationCounter is None, "langchain is not installed")
+class TestAgentMetrics(unittest.TestCase):
+    """
+    Test the agent metrics in the model.py file
+    """
+
+    def test_iteration_counter(self):
+        counter = AgentIterationCounter()
+        counter.on_agent_action(action=None)
+        counter.on_agent_action(action=None)
+        counter.on_agent_finish(finish=None)
+        self.assertEqual(counter.tool_calls, 2)
+        self.assertEqual(counter.iterations, 3)
+
+    @patch("builtins.open", new_callable=mock_open)
+    def test_save_question_metrics(self, mock_file_open):
+        save_question_metrics({"question": "How many leases?", "iterations": 3}, "metrics.jsonl")
+        mock_file_open.assert_called_once_with("metrics.jsonl", 'a')
+        mock_file_open().write.assert_called_once_with('{"question": "How many leases?", "iterations": 3}\n')
+
 
+class TestEntityResolution(BaseTestData):
+    """
+    Test the entity_resolution.py file
+    """
 
+    def test_split_unit_and_building(self):
+        self.assertEqual(split_unit_and_building("Flat  207, Landmark West Tower (second floor flat)"),
+                         ("207", "landmark west tower"))
+        self.assertEqual(split_unit_and_building("Flat 2207 Landmark West Tower (twenty second floor flat)"),
+                         ("2207", "landmark west tower"))
+        # The same flat with and without the word "Flat", merged into one unit by PropertyIndex
+        self.assertEqual(split_unit_and_building("Flat 50 Sheringham (Fourth Floor Flat)"), ("50", "sheringham"))
+        self.assertEqual(split_unit_and_building("50 Sheringham (Fourth Floor Flat)"), ("50 fourth", "sheringham"))
+        self.assertEqual(split_unit_and_building("Flats 69 and 70 Walsingham (Eighth Floor Flats)"),
+                         ("69 and 70", "walsingham"))
+        self.assertEqual(split_unit_and_building("69 and 70 Walsingham (Eighth Floor Flat)"),
+                         ("69 and 70 eighth", "walsingham"))
+        self.assertEqual(split_unit_and_building("23 Sheringham (Fifth Floor Flat) and Garage 7"),
+                         ("23 fifth", "sheringham"))
+        self.assertEqual(split_unit_and_building("Parking space 10 (basement level)"), ("parking space 10", ""))
+
+    def test_split_keeps_floor_without_unit_number(self):
+        self.assertEqual(split_unit_and_building("3 Market Place (Ground floor)"), ("3 ground", "market place"))
+        self.assertEqual(split_unit_and_building("3 Market Place (First and Second Floor Flat)"),
+                         ("3 first second", "market place"))
+        self.assertEqual(split_unit_and_building("3 Market Place (Basement Unit)"), ("3 basement", "market place"))
+        self.assertEqual(split_unit_and_building("21 Sheen Road (Ground floor shop)"), ("21 ground", "sheen road"))
+        self.assertEqual(split_unit_and_building("21 Sheen Road (first and second floors)"),
+                         ("21 first second", "sheen road"))
+        self.assertEqual(split_unit_and_building("Third floor, Spencer House"), ("third", "spencer house"))
+        self.assertEqual(split_unit_and_building("First floor (part of) Spencer House"), ("first", "spencer house"))
+        self.assertEqual(split_unit_and_building("Ground Floor Flat, 34 Bluebell Road"), ("34 ground", "bluebell road"))
+        self.assertEqual(split_unit_and_building("Second Floor Flat, 34 Bluebell Road"), ("34 second", "bluebell road"))
+        self.assertEqual(split_unit_and_building("Basement Flat, 34 Bluebell Road"), ("34 basement", "bluebell road"))
+        self.assertEqual(split_unit_and_building("Flat A, 34 Bluebell Road"), ("34 flat a", "bluebell road"))
+
+    def test_split_plurals_ranges_and_measurements(self):
+        self.assertEqual(split_unit_and_building("Parking spaces 192 and 193 (basement level)"),
+                         ("parking space 192 and 193", ""))
+        self.assertEqual(split_unit_and_building("Parking spaces 175,188 and 189 (basement level)"),
+                         ("parking space 175 188 and 189", ""))
+        self.assertEqual(split_unit_and_building("Parking spaces 1&2 Landmark West Tower (basement level)"),
+                         ("parking space 1 and 2", "landmark west tower"))
+        self.assertEqual(split_unit_and_building("88-96 Town Centre"), ("88 to 96", "town centre"))
+        # A range of two consecutive numbers is the same as listing both
+        self.assertEqual(split_unit_and_building("59-60 Paddington Street"), ("59 and 60", "paddington street"))
+        self.assertEqual(split_unit_and_building("59 & 60 Paddington Street"), ("59 and 60", "paddington street"))
+        self.assertEqual(split_unit_and_building("6-7 Garbutt Place"), split_unit_and_building("6 and 7 Garbutt Place"))
+        self.assertEqual(split_unit_and_building("17c and 17d Town Centre"), ("17c and 17d", "town centre"))
+        self.assertEqual(split_unit_and_building("17 acres of land at Almshouses, Ulpha"),
+                         ("", "17 acres of land at almshouses ulpha"))
+
+    def test_property_index_merges_units_without_floors(self):
+        lease_entries = []
+        for i, description in enumerate(["Flat 50 Sheringham (Fourth Floor Flat)", "50 Sheringham (Fourth Floor Flat)",
+                                         "Flats 69 and 70 Walsingham (Eighth Floor Flats)",
+                                         "69 and 70 Walsingham (Eighth Floor Flat)",
+                                         "3 Market Place", "3 Market Place (Ground floor)",
+                                         "3 Market Place (Basement Unit)"]):
+            lease_entry = LeaseEntry([], str(i), 0)
+            lease_entry.property_description = description
+            lease_entries.append(lease_entry)
+
+        buildings = PropertyIndex(lease_entries).group_by_building()
+        self.assertEqual(list(buildings["sheringham"].keys()), ["50 fourth"])
+        self.assertEqual(len(buildings["sheringham"]["50 fourth"]), 2)
+        self.assertEqual(list(buildings["walsingham"].keys()), ["69 and 70 eighth"])
+        # The floorless unit is ambiguous between two floors so it is kept apart
+        self.assertEqual(set(buildings["market place"].keys()), {"3", "3 ground", "3 basement"})
+
+    def test_cluster_building_keys(self):
+        canonical_keys = cluster_building_keys(Counter({
+            "landmark west tower": 3,
+            "landmarkwest tower": 1,
+            "landmark east tower": 2,
+        }))
+        self.assertEqual(canonical_keys["landmarkwest tower"], "landmark west tower")
+        self.assertEqual(canonical_keys["landmark east tower"], "landmark east tower")
+
+    def test_cluster_building_keys_merges_typos(self):
+        canonical_keys = cluster_building_keys(Counter({
+            "harbord close": 3,
+            "harbrd close": 1,
+            "j sainsbury plc": 2,
+            "j sainsburys plc": 1,
+            "mill lane": 2,
+            "hill lane": 1,
+        }))
+        self.assertEqual(canonical_keys["harbrd close"], "harbord close")
+        self.assertEqual(canonical_keys["j sainsburys plc"], "j sainsbury plc")
+        # A substituted letter is more likely a different building than a typo
+        self.assertEqual(canonical_keys["hill lane"], "hill lane")
+
+    def test_cluster_building_keys_bounds_comparisons_per_key(self):
+        # A small alphabet makes the keys share many n-grams, as street names do in a large register
+        rng = random.Random(0)
+        words = ["".join(rng.choice("abcdefgh") for _ in range(rng.randint(4, 7))) for _ in range(500)]
+        max_comparisons = entity_resolution.MAX_BLOCKS_PER_KEY * entity_resolution.MAX_BLOCK_SIZE
+        for key_count in (500, 5000):
+            building_keys = Counter()
+            while len(building_keys) < key_count:
+                building_keys[" ".join(rng.choice(words) for _ in range(2))] += 1
+            comparisons = Counter()
+            similarity = entity_resolution._similarity
+
+            def count_comparisons(key, *args):
+                comparisons[key] += 1
+                return similarity(key, *args)
+
+            with patch("entity_resolution._similarity", new=count_comparisons):
+                cluster_building_keys(building_keys)
+            self.assertLessEqual(max(comparisons.values()), max_comparisons)
+
+    def test_cluster_building_keys_does_not_chain_or_merge_codes(self):
+        canonical_keys = cluster_building_keys(Counter({
+            "cobalt business park": 3,
+            "dc2 cobalt business park": 1,
+            "dc3 cobalt business park": 1,
+            "parking spaces 16": 1,
+            "parking spaces 192": 1,
+        }))
+        self.assertEqual(canonical_keys["dc2 cobalt business park"], "dc2 cobalt business park")
+        self.assertEqual(canonical_keys["dc3 cobalt business park"], "dc3 cobalt business park")
+        self.assertEqual(canonical_keys["parking spaces 16"], "parking spaces 16")
+
+    def test_property_index(self):
+        processed_page = process_page(self.schedule_entries_1, 0)
+        lease_entries = [entry for entries in processed_page.values() for entry in entries]
+        lease_entries.append(LeaseEntry(self.multiple_space_entry, "5", 0))
+        property_index = PropertyIndex(lease_entries)
+
+        buildings = property_index.group_by_building()
+        self.assertEqual(set(buildings["bluebell road"].keys()), {"34 second", "26 ground", "36"})
+        self.assertEqual(list(buildings["landmark west tower"].keys()), ["parking space 10"])
+        self.assertEqual(property_index.building_summary()[0]["entries"], 3)
+        self.assertEqual(property_index.find_by_title(" k941967"), buildings["bluebell road"]["34 second"])
@@ -9,6 +9,19 @@ class EntryTypes(Enum):
     CANCELLED_ITEM_SCHEDULE_OF_NOTICES_OF_LEASES = "Cancelled Item - Schedule of Notices of Leases"
 
 
+class QuarantineReasons(Enum):
+    """
+    Enum to represent the reasons an entry can be quarantined
+    """
+    INVALID_ENTRY = "invalid_entry"
+    MISSING_ENTRY_NUMBER = "missing_entry_number"
+    MISSING_ENTRY_TEXT = "missing_entry_text"
+    INVALID_ENTRY_TEXT_TYPE = "invalid_entry_text_type"
+    EMPTY_ENTRY_TEXT = "empty_entry_text"
+    NON_STRING_LINE = "non_string_line"
+    PARSE_ERROR = "parse_error"
+
+
 class LeaseEntryError(ValueError, TypeError, AttributeError):
     def __init__(self, message="Invalid data received"):
         self.message = message